@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+export_onnx.py — one-shot export of the embedding model to ONNX + dynamic int8 quantization.
+rag.py picks the quantized model up automatically from RAG_ONNX_DIR (default chatbot_sih/onnx_mpnet).
+
+Usage:
+  pip install "optimum[onnxruntime]"
+  python chatbot_sih/src/export_onnx.py
+  python chatbot_sih/src/export_onnx.py --arch arm64 --out chatbot_sih/onnx_mpnet
+"""
+import argparse
+import os
+import tempfile
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+MODEL_ID = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+DEFAULT_OUT = os.path.join("chatbot_sih", "onnx_mpnet")
+
+# dynamic (weights-only) int8 configs per CPU family
+QUANT_CONFIGS = {
+    "avx512_vnni": lambda: AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+    "avx2": lambda: AutoQuantizationConfig.avx2(is_static=False, per_channel=False),
+    "arm64": lambda: AutoQuantizationConfig.arm64(is_static=False, per_channel=False),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=MODEL_ID, help="HF model id to export")
+    parser.add_argument("--out", default=os.getenv("RAG_ONNX_DIR", DEFAULT_OUT), help="Output directory")
+    parser.add_argument("--arch", choices=sorted(QUANT_CONFIGS), default="avx2", help="Quantization target CPU")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"[export_onnx] Exporting {args.model} to ONNX ...")
+        model = ORTModelForFeatureExtraction.from_pretrained(args.model, export=True)
+        model.save_pretrained(tmp_dir)
+
+        print(f"[export_onnx] Quantizing to int8 ({args.arch}) ...")
+        quantizer = ORTQuantizer.from_pretrained(tmp_dir)
+        quantizer.quantize(save_dir=args.out, quantization_config=QUANT_CONFIGS[args.arch]())
+
+    tokenizer.save_pretrained(args.out)
+    print(f"[export_onnx] Saved quantized model to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,221 @@
 #!/usr/bin/env python3
 """
 Local ingest -> FAISS using sentence-transformers (no external APIs).
-This version uses the langchain_community SentenceTransformerEmbeddings wrapper and
-FAISS.from_documents(..., embedding=...) so it is compatible with your langchain_community version.
+Chunks are encoded in one batched SentenceTransformer.encode call and stored in an
+HNSW (or IVFPQ for very large corpora) FAISS index; the langchain_community SentenceTransformerEmbeddings wrapper
+is only attached for query-time embedding. Re-runs are incremental: chunks are content-hashed and
+only unseen ones are embedded and appended (INGEST_REBUILD=1 forces a full rebuild).
 """
 
 import os
 import json
+import uuid
+import shutil
+import tempfile
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from typing import List
 from pathlib import Path
-
-# sentence-transformers will be used via the langchain wrapper (no manual encode needed)
+import numpy as np
+import faiss
+import torch
+# chunks are encoded directly with sentence-transformers (one batched call for the corpus);
+# the langchain wrapper is kept for query-time embedding inside the saved FAISS store
+from sentence_transformers import SentenceTransformer
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain.schema import Document
+from transformers import AutoTokenizer
+try:
+    # optional: very fast non-cryptographic chunk hashing (falls back to blake2b)
+    import xxhash
+except Exception:
+    xxhash = None
+try:
+    # optional: columnar + snappy metadata dump (falls back to JSON without it)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = pq = None
 
 # === CONFIG ===
+# Torch CPU threads for encoding (RAG_TORCH_THREADS, shared with rag.py). The PDF worker
+# processes below don't run torch; if you add model work to them, keep this small (e.g. 2)
+# per worker to avoid oversubscribing cores.
+torch.set_num_threads(int(os.environ.get("RAG_TORCH_THREADS", os.cpu_count() or 4)))
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    pass
+
 BASE_DIR = Path.cwd()
 PDF_DIR = BASE_DIR / "chatbot_sih" / "pdfs"
 INDEX_DIR = BASE_DIR / "chatbot_sih" / "faiss_index"
 
 # model choices: small -> fast, larger -> better quality (more RAM/time)
 MODEL_NAME = "paraphrase-multilingual-mpnet-base-v2"   # you used this and it works for you
-CHUNK_SIZE = 600
-CHUNK_OVERLAP = 120
-BATCH_SIZE = 64   # used by the wrapper internally (if supported)
+# chunk sizes are in tokens of the embedding model (max_seq_length=128), so chunks aren't truncated
+CHUNK_SIZE = 120
+CHUNK_OVERLAP = 20
+BATCH_SIZE = 64   # batch size for SentenceTransformer.encode
+# Embeddings are L2-normalized, so inner product == cosine similarity.
+# ANN index: HNSW below IVFPQ_MIN_CHUNKS vectors, IVFPQ (~16x smaller) above
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVFPQ_MIN_CHUNKS = 1_000_000
+IVFPQ_NLIST = 256
+IVFPQ_M = 32
+IVFPQ_NBITS = 8
+IVFPQ_NPROBE = 16
+# Incremental ingest: chunks whose content hash is in chunk_hashes.json are not re-embedded.
+# The file also records hash algo, model and chunking; a mismatch (or INGEST_REBUILD=1)
+# ignores the existing index and rebuilds from scratch.
+HASHES_FILE = "chunk_hashes.json"
+HASH_ALGO = "xxh64" if xxhash is not None else "blake2b-64"
+INGEST_REBUILD = os.getenv("INGEST_REBUILD") == "1"
+# docs metadata dump: "parquet" (needs pyarrow) or "json"
+INGEST_META_FORMAT = os.getenv("INGEST_META_FORMAT", "parquet").strip().lower()
+# PDF load+split runs in a process pool; set INGEST_WORKERS=1 to force sequential
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
 
 def find_pdfs(pdf_dir: Path) -> List[Path]:
     return sorted([p for p in pdf_dir.iterdir() if p.suffix.lower() == ".pdf"])
 
-def load_and_split(pdf_path: Path, splitter: RecursiveCharacterTextSplitter) -> List[Document]:
+@lru_cache(maxsize=None)
+def _get_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    # only the tokenizer is loaded (not model weights), once per process
+    tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{MODEL_NAME}")
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        tokenizer, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+def load_and_split(pdf_path: Path, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Document]:
+    # the splitter is looked up here (not passed in) so this can run in a worker process
+    splitter = _get_splitter(chunk_size, chunk_overlap)
     loader = PyPDFLoader(str(pdf_path))
-    pages = loader.load()
-    chunks = splitter.split_documents(pages)
-    # attach source filename in metadata for traceability
-    for c in chunks:
-        c.metadata = dict(c.metadata or {})
-        c.metadata["source_file"] = pdf_path.name
+    chunks: List[Document] = []
+    # stream pages one at a time instead of materializing the whole PDF first
+    for page in loader.lazy_load():
+        meta = dict(page.metadata or {})
+        # attach source filename in metadata for traceability
+        meta["source_file"] = pdf_path.name
+        for text in splitter.split_text(page.page_content):
+            chunks.append(Document(page_content=text, metadata=dict(meta)))
     return chunks
 
-def save_metadata_docs(docs: List[Document], meta_path: Path):
+def _text_lengths(model: SentenceTransformer, texts: List[str]) -> List[int]:
+    lengths = [len(t) for t in texts]
+    # character length is a good enough proxy unless chunk sizes are very uneven
+    if lengths and max(lengths) > 10 * max(1, min(lengths)):
+        lengths = [len(model.tokenizer.tokenize(t)) for t in texts]
+    return lengths
+
+def embed_texts(model: SentenceTransformer, texts: List[str]) -> np.ndarray:
+    """Encode texts sorted by length (less padding per batch), returned in input order."""
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    order = np.argsort(_text_lengths(model, texts), kind="stable")
+    embs = model.encode([texts[i] for i in order], batch_size=BATCH_SIZE, convert_to_numpy=True,
+                        normalize_embeddings=True, show_progress_bar=True)
+    embs_out = np.empty_like(embs)
+    embs_out[order] = embs
+    return embs_out
+
+def build_faiss_index(embs: np.ndarray):
+    embs = np.ascontiguousarray(embs, dtype=np.float32)
+    dim = embs.shape[1]
+    if len(embs) >= IVFPQ_MIN_CHUNKS:
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, IVFPQ_NLIST, IVFPQ_M, IVFPQ_NBITS,
+                                 faiss.METRIC_INNER_PRODUCT)
+        index.train(embs)
+        index.nprobe = IVFPQ_NPROBE
+        # MMR search reconstructs candidate vectors by id
+        index.make_direct_map()
+    else:
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    index.add(embs)
+    return index
+
+def build_faiss_store(docs: List[Document], embs: np.ndarray, emb_wrapper) -> FAISS:
+    index = build_faiss_index(embs)
+    ids = [str(uuid.uuid4()) for _ in docs]
+    docstore = InMemoryDocstore({_id: d for _id, d in zip(ids, docs)})
+    return FAISS(embedding_function=emb_wrapper, index=index, docstore=docstore,
+                 index_to_docstore_id=dict(enumerate(ids)),
+                 distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT)
+
+def chunk_hash(text: str) -> str:
+    data = text.encode("utf-8")
+    if xxhash is not None:
+        return xxhash.xxh64(data).hexdigest()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+def save_store_atomic(faiss_db: FAISS, index_dir: Path):
+    """
+    save_local into a temp dir next to the index, then os.replace the files into place.
+    A running server may have index.faiss memory-mapped (IVF lists); rewriting that file in
+    place could SIGBUS it, while a rename leaves its open inode intact. index.faiss is
+    replaced last, since its mtime is what the server's answer cache is keyed on.
+    """
+    tmp_dir = Path(tempfile.mkdtemp(prefix=".save-", dir=index_dir))
+    try:
+        faiss_db.save_local(str(tmp_dir))
+        for name in ("index.pkl", "index.faiss"):
+            os.replace(tmp_dir / name, index_dir / name)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _index_settings() -> dict:
+    """Everything that decides which vectors a chunk gets; any change needs a full rebuild."""
+    return {"algo": HASH_ALGO, "model": MODEL_NAME,
+            "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+def load_chunk_hashes(path: Path) -> set:
+    """
+    Known hashes, or an empty set (-> full rebuild) if missing or written with different
+    settings: another hash function, embedding model or chunking would otherwise append
+    re-chunked text / foreign vectors to the old index.
+    """
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    settings = _index_settings()
+    if any(data.get(k) != v for k, v in settings.items()):
+        print(f"[ingest] Index was built with different settings ({HASHES_FILE}); rebuilding from scratch.")
+        return set()
+    return set(data.get("hashes", []))
+
+def save_chunk_hashes(path: Path, hashes: set):
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({**_index_settings(), "hashes": sorted(hashes)}, f)
+
+def save_metadata_docs(docs: List[Document], meta_path: Path) -> Path:
+    """Write chunk texts + metadata; returns the path actually written (.parquet or .json)."""
     meta_list = [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]
     meta_path.parent.mkdir(parents=True, exist_ok=True)
-    with meta_path.open("w", encoding="utf-8") as f:
+    if INGEST_META_FORMAT == "parquet" and pq is not None:
+        try:
+            out = meta_path.with_suffix(".parquet")
+            pq.write_table(pa.Table.from_pylist(meta_list), str(out), compression="snappy")
+            return out
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            # e.g. metadata values of mixed types across PDFs
+            print(f"[ingest] Parquet metadata failed ({e}); writing JSON instead.")
+    out = meta_path.with_suffix(".json")
+    with out.open("w", encoding="utf-8") as f:
         json.dump(meta_list, f, ensure_ascii=False)
+    return out
 
 def main():
     print("[ingest] Using local embeddings via SentenceTransformerEmbeddings (langchain_community).")
@@ -57,30 +227,74 @@ def main():
         print(f"[ingest] No PDFs found in {PDF_DIR}. Place files there and re-run.")
         return
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     all_chunks: List[Document] = []
-    for p in pdfs:
-        print(f"[ingest] Loading {p} ...")
-        chunks = load_and_split(p, splitter)
-        all_chunks.extend(chunks)
+    workers = min(INGEST_WORKERS, len(pdfs))
+    if workers <= 1:
+        for p in pdfs:
+            print(f"[ingest] Loading {p} ...")
+            all_chunks.extend(load_and_split(p))
+    else:
+        print(f"[ingest] Loading {len(pdfs)} PDFs with {workers} worker processes ...")
+        worker = partial(load_and_split, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            # ex.map keeps the input order, so chunk order matches the sequential path
+            for p, chunks in zip(pdfs, ex.map(worker, pdfs)):
+                print(f"[ingest] Loaded {p} ({len(chunks)} chunks)")
+                all_chunks.extend(chunks)
 
     print(f"[ingest] Total chunks: {len(all_chunks)}")
 
-    # Create the langchain/community wrapper that internally uses sentence-transformers
-    print(f"[ingest] Creating embeddings wrapper using model: {MODEL_NAME} ...")
-    emb_wrapper = SentenceTransformerEmbeddings(model_name=MODEL_NAME)
+    # The wrapper is only used for query-time embedding (similarity_search on the loaded store);
+    # its SentenceTransformer is reused for encoding so the model is only loaded once
+    print(f"[ingest] Loading embedding model: {MODEL_NAME} ...")
+    emb_wrapper = SentenceTransformerEmbeddings(model_name=MODEL_NAME,
+                                                encode_kwargs={"normalize_embeddings": True})
+    model = emb_wrapper.client
+
+    hashes_path = INDEX_DIR / HASHES_FILE
+    faiss_db = None
+    known = set()
+    if not INGEST_REBUILD and (INDEX_DIR / "index.faiss").exists():
+        known = load_chunk_hashes(hashes_path)
+        if known:
+            faiss_db = FAISS.load_local(str(INDEX_DIR), emb_wrapper, allow_dangerous_deserialization=True,
+                                        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT)
+            print(f"[ingest] Existing index has {len(known)} chunks; embedding only new ones.")
+
+    # skip chunks already in the index, and duplicates within this run
+    new_chunks: List[Document] = []
+    new_hashes = set()
+    for c in all_chunks:
+        h = chunk_hash(c.page_content)
+        if h in known or h in new_hashes:
+            continue
+        new_hashes.add(h)
+        new_chunks.append(c)
+    print(f"[ingest] New unique chunks: {len(new_chunks)}")
+    if not new_chunks:
+        print("[ingest] Nothing new to embed. Done.")
+        return
+
+    print(f"[ingest] Encoding chunks (batch_size={BATCH_SIZE}) ...")
+    texts = [c.page_content for c in new_chunks]
+    embs = embed_texts(model, texts)
 
-    # Build FAISS index; LangChain will compute embeddings in a memory-friendly way internally.
-    print("[ingest] Building FAISS index (LangChain will compute embeddings)...")
-    faiss_db = FAISS.from_documents(all_chunks, embedding=emb_wrapper)
+    if faiss_db is None:
+        kind = "IVFPQ" if len(embs) >= IVFPQ_MIN_CHUNKS else "HNSW"
+        print(f"[ingest] Building FAISS {kind} index from precomputed embeddings...")
+        faiss_db = build_faiss_store(new_chunks, embs, emb_wrapper)
+    else:
+        print("[ingest] Appending new embeddings to the existing FAISS index...")
+        faiss_db.add_embeddings(list(zip(texts, embs)), metadatas=[c.metadata for c in new_chunks])
 
-    # Save index and metadata
+    # Save index, hashes and metadata
     INDEX_DIR.mkdir(parents=True, exist_ok=True)
-    faiss_db.save_local(str(INDEX_DIR))
+    save_store_atomic(faiss_db, INDEX_DIR)
+    save_chunk_hashes(hashes_path, known | new_hashes)
     print(f"[ingest] FAISS index saved to {INDEX_DIR}")
 
-    meta_path = INDEX_DIR / "docs_metadata.json"
-    save_metadata_docs(all_chunks, meta_path)
+    all_docs = [faiss_db.docstore.search(_id) for _id in faiss_db.index_to_docstore_id.values()]
+    meta_path = save_metadata_docs(all_docs, INDEX_DIR / "docs_metadata.json")
     print(f"[ingest] Saved docs metadata to {meta_path}")
     print("[ingest] Done.")
 
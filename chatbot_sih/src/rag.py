@@ -9,48 +9,110 @@ rag.py — RAG logic without Streamlit.
 import os
 import io
 import json
+import logging
 import asyncio
-from functools import lru_cache
+import pickle
+import shelve
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from typing import List, Tuple, Dict, Any
+import numpy as np
+import torch
+import faiss
 
 # Langchain & Google imports (same as before)
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy, maximal_marginal_relevance
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
+from langchain_core.embeddings import Embeddings
 try:
     from sentence_transformers import CrossEncoder  # optional reranker
 except Exception:  # pragma: no cover
     CrossEncoder = None
+try:
+    # optional int8 ONNX embedder (see export_onnx.py)
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+except Exception:  # pragma: no cover
+    ORTModelForFeatureExtraction = None
 
 # Sarvam (for translation)
 from sarvamai import SarvamAI
 
+log = logging.getLogger("rag")
+
 # -------------------- Load API Keys & event loop fix --------------------
 load_dotenv()
 SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("openai_api_key")
 
-# Ensure asyncio loop exists in this thread (fix for grpc.aio)
+# Cap torch CPU threads before any model is created (default: all cores)
+torch.set_num_threads(int(os.environ.get("RAG_TORCH_THREADS", os.cpu_count() or 4)))
 try:
-    asyncio.get_running_loop()
+    torch.set_num_interop_threads(1)
 except RuntimeError:
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    # already set (or parallel work already started) in this process
+    pass
+
+# Ensure asyncio loop exists in this thread (fix for grpc.aio)
+def _ensure_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        try:
+            asyncio.get_event_loop_policy().get_event_loop()
+        except RuntimeError:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+_ensure_event_loop()
+
+# RAG_HEDGE=1 sends each question to Gemini and OpenAI concurrently and keeps the first answer
+HEDGE_LLM = os.getenv("RAG_HEDGE") == "1"
+# Each hedged question holds two workers, and the losing call keeps its worker until its
+# HTTP request returns (cancel() can't stop a running future), so the pool is sized for
+# 2x the concurrent questions (server: one per to_thread worker, at most 32) rather than
+# letting new questions queue behind losers. RAG_HEDGE_WORKERS overrides; threads start lazily.
+_HEDGE_POOL = (ThreadPoolExecutor(max_workers=int(os.getenv("RAG_HEDGE_WORKERS", "64")),
+                                  thread_name_prefix="rag-hedge") if HEDGE_LLM else None)
 
 # Configure clients (no direct google.generativeai import/config needed)
 client = SarvamAI(api_subscription_key=SARVAM_API_KEY)
+# Sarvam translate shares stt's process-wide SARVAM_CONCURRENCY budget (one semaphore for
+# STT + translate); package import for the server, bare one when run as a script
+try:
+    from chatbot_sih.src.stt import SARVAM_SLOTS
+except ImportError:
+    from stt import SARVAM_SLOTS
 
 # -------------------- Globals for reused models/index --------------------
 _EMBEDDINGS = None  # type: Any
 _DB = None  # type: Any
+_DB_MTIME = 0.0  # index.faiss mtime of the files _DB was read from
 _CROSS = None  # type: Any
+_LOAD_LOCK = threading.Lock()
+_GPU_RES = None  # type: Any  # must outlive the GPU index that uses it
+# torch honours CUDA_VISIBLE_DEVICES, so an empty value keeps everything on CPU
+USE_CUDA = torch.cuda.is_available()
+# RAG_TORCH_COMPILE=1 compiles the embedder with torch.compile (slow first load, faster steady state)
+TORCH_COMPILE = os.getenv("RAG_TORCH_COMPILE") == "1"
 INDEX_PATH = os.path.join("chatbot_sih", "faiss_index")
+ONNX_DIR = os.getenv("RAG_ONNX_DIR", os.path.join("chatbot_sih", "onnx_mpnet"))
+ONNX_FILE_NAME = "model_quantized.onnx"
+
+# Answer cache keyed by the normalized question; persisted with shelve (RAG_ANSWER_CACHE="" disables disk)
+_ANSWER_CACHE = OrderedDict()  # type: OrderedDict
+_ANSWER_CACHE_MAX = 256
+_ANSWER_CACHE_LOCK = threading.Lock()
+ANSWER_CACHE_PATH = os.getenv("RAG_ANSWER_CACHE", os.path.join(INDEX_PATH, "answer_cache"))
 
 # Language map (same mapping as your old UI)
 LANGUAGES = {
@@ -62,6 +124,11 @@ LANGUAGES = {
     "Punjabi": "pa-IN"
 }
 
+# Retrieved docs more similar than this (cosine) to an earlier doc are dropped as redundant
+REDUNDANT_SIM = 0.95
+# RAG_RERANK=biencoder|crossencoder|none
+RERANK_MODE = os.getenv("RAG_RERANK", "biencoder").strip().lower()
+
 # Light-weight synonyms to improve recall (can be extended)
 SYNONYMS = {
     "mba": ["master of business administration", "mba program"],
@@ -125,28 +192,216 @@ def _doc_sources(docs: List) -> List[Dict[str, Any]]:
     return sources
 
 
+class ORTEmbeddings(Embeddings):
+    """Int8 ONNX-Runtime version of the mpnet embedder: mean pooling + L2 normalize."""
+
+    def __init__(self, model_dir: str, file_name: str = ONNX_FILE_NAME, batch_size: int = 32, max_length: int = 128):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=file_name)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            enc = self.tokenizer(texts[i:i + self.batch_size], padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            hidden = self.model(**enc).last_hidden_state
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.concatenate(out) if out else np.empty((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def _make_embeddings():
+    if ORTModelForFeatureExtraction is not None and os.path.exists(os.path.join(ONNX_DIR, ONNX_FILE_NAME)):
+        return ORTEmbeddings(ONNX_DIR)
+    # ingest stores L2-normalized vectors in an inner-product index; normalize queries to match
+    emb = HuggingFaceEmbeddings(model_name="paraphrase-multilingual-mpnet-base-v2",
+                                model_kwargs={"device": "cuda" if USE_CUDA else "cpu"},
+                                encode_kwargs={"normalize_embeddings": True})
+    if TORCH_COMPILE:
+        _compile_embedder(emb)
+    return emb
+
+
+def _compile_embedder(emb):
+    """torch.compile the transformer inside the SentenceTransformer and warm it up once."""
+    st = getattr(emb, "_client", None) or getattr(emb, "client", None)
+    if st is None or not hasattr(torch, "compile"):
+        return
+    eager = st[0].auto_model
+    try:
+        st[0].auto_model = torch.compile(eager, dynamic=True)
+        # pay the compile cost here rather than on the first real question
+        emb.embed_query("warm up")
+    except Exception as e:
+        st[0].auto_model = eager
+        log.warning("torch.compile unavailable, using eager model: %s", e)
+
+
+def _index_to_gpu(index):
+    """Move a FAISS index to GPU 0 when faiss-gpu and CUDA are available (HNSW stays on CPU)."""
+    global _GPU_RES
+    if not USE_CUDA or not hasattr(faiss, "StandardGpuResources") or isinstance(index, faiss.IndexHNSW):
+        return index
+    try:
+        if _GPU_RES is None:
+            _GPU_RES = faiss.StandardGpuResources()
+        return faiss.index_cpu_to_gpu(_GPU_RES, 0, index)
+    except Exception as e:
+        log.warning("Keeping FAISS index on CPU: %s", e)
+        return index
+
+
+def _read_faiss_files(index_path: str):
+    """
+    Read the files written by FAISS.save_local without going through load_local (which needs the
+    embedder up front). IO_FLAG_MMAP only takes effect for IVF indexes (IVFPQ, >= 1M chunks):
+    their inverted lists are memory-mapped read-only and paged in on demand. HNSW and flat
+    indexes are still read fully into RAM (faiss 1.7.4 ignores the flag for them).
+    """
+    index = faiss.read_index(os.path.join(index_path, "index.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    # index.pkl is produced by our own ingest.py (same trust level as allow_dangerous_deserialization)
+    with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return _index_to_gpu(index), docstore, index_to_docstore_id
+
+
+def _index_mtime() -> float:
+    try:
+        return os.path.getmtime(os.path.join(INDEX_PATH, "index.faiss"))
+    except OSError:
+        return 0.0
+
+
 def _load_embeddings_and_index():
-    global _EMBEDDINGS, _DB
-    if _EMBEDDINGS is None:
-        _EMBEDDINGS = HuggingFaceEmbeddings(model_name="paraphrase-multilingual-mpnet-base-v2")
-    if _DB is None and os.path.exists(INDEX_PATH) and os.path.exists(os.path.join(INDEX_PATH, "index.faiss")):
-        _DB = FAISS.load_local(INDEX_PATH, _EMBEDDINGS, allow_dangerous_deserialization=True)
+    """
+    Load the embedder and index once; the index is re-read when ingest replaces index.faiss
+    (its mtime differs from _DB_MTIME). In-flight questions keep the db they already hold.
+    """
+    global _EMBEDDINGS, _DB, _DB_MTIME
+    if _EMBEDDINGS is not None and _DB is not None and _index_mtime() == _DB_MTIME:
+        return _EMBEDDINGS, _DB
+    # concurrent first requests would otherwise each load their own model copy
+    with _LOAD_LOCK:
+        # stat before reading: if ingest swaps the files mid-read, the next call reloads again
+        mtime = _index_mtime()
+        need_db = bool(mtime) and (_DB is None or mtime != _DB_MTIME)
+        # the index/docstore don't depend on the embedder, so read them while the model loads
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            files = ex.submit(_read_faiss_files, INDEX_PATH) if need_db else None
+            if _EMBEDDINGS is None:
+                _EMBEDDINGS = _make_embeddings()
+            if files is not None:
+                index, docstore, index_to_docstore_id = files.result()
+                _DB = FAISS(embedding_function=_EMBEDDINGS, index=index, docstore=docstore,
+                            index_to_docstore_id=index_to_docstore_id,
+                            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT)
+                _DB_MTIME = mtime
     return _EMBEDDINGS, _DB
 
 
+# RAG_EAGER_INIT=1 loads the embedder and index at import so the first question isn't charged for it
+if os.getenv("RAG_EAGER_INIT") == "1":
+    _load_embeddings_and_index()
+
+
 def _expand_queries(user_question: str) -> List[str]:
     q = (user_question or "").strip()
     if not q:
         return [q]
-    variants = {q}
     q_lower = q.lower()
-    for key, syns in SYNONYMS.items():
-        if key in q_lower:
-            for s in syns:
-                variants.add(q_lower.replace(key, s))
+    # most questions contain no synonym key: a single retrieval pass is enough
+    keys = [k for k in SYNONYMS if k in q_lower]
+    if not keys:
+        return [q]
+    # ordered + de-duplicated; the original question always comes first
+    variants = [q]
+    for key in keys:
+        for s in SYNONYMS[key]:
+            v = q_lower.replace(key, s)
+            if v not in variants:
+                variants.append(v)
     # basic punctuation/whitespace normalization
-    variants.add(" ".join(q_lower.split()))
-    return list(variants)[:6]
+    norm = " ".join(q_lower.split())
+    if norm not in variants:
+        variants.append(norm)
+    return variants[:6]
+
+
+def _mmr_search_batch(db, qvecs, k: int = 6, fetch_k: int = 18, lambda_mult: float = 0.5) -> Tuple[List, Any]:
+    """
+    MMR retrieval for several query vectors with a single FAISS index.search call
+    (one BLAS pass) instead of one search per query; rows are MMR-selected afterwards.
+    Returns (docs, vecs): vecs[i] is the stored vector of docs[i], reconstructed from the
+    index, so later stages don't have to run the passages through the embedder again.
+    """
+    xq = np.ascontiguousarray(np.asarray(qvecs, dtype=np.float32))
+    _, ids = db.index.search(xq, fetch_k)
+    uniq = sorted({int(i) for i in ids.ravel() if i != -1})
+    if not uniq:
+        return [], None
+    vec_by_id = dict(zip(uniq, db.index.reconstruct_batch(np.asarray(uniq, dtype=np.int64))))
+    out: List = []
+    out_vecs: List = []
+    for qvec, row in zip(xq, ids):
+        row = [int(i) for i in row if i != -1]
+        picked = maximal_marginal_relevance(qvec, [vec_by_id[i] for i in row], k=k, lambda_mult=lambda_mult)
+        for j in picked:
+            doc = db.docstore.search(db.index_to_docstore_id[row[j]])
+            if not isinstance(doc, str):  # docstore returns an error string for missing ids
+                out.append(doc)
+                out_vecs.append(vec_by_id[row[j]])
+    return out, (np.asarray(out_vecs, dtype=np.float32) if out_vecs else None)
+
+
+def _filter_redundant(docs: List, embeddings, vecs=None) -> Tuple[List, Any]:
+    """
+    Greedily keep docs whose cosine similarity to every already-kept doc is below REDUNDANT_SIM.
+    vecs (one row per doc) are used when given; otherwise the docs are embedded here.
+    Returns (kept_docs, kept_vecs); kept_vecs is None when no vectors were available.
+    """
+    if vecs is None:
+        if len(docs) < 2:
+            return docs, None
+        try:
+            vecs = np.asarray(embeddings.embed_documents([getattr(d, "page_content", "") for d in docs]), dtype=np.float32)
+        except Exception:
+            return docs, None
+    vecs = np.asarray(vecs, dtype=np.float32)
+    vecs = vecs / np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+    sims = vecs @ vecs.T
+    kept: List[int] = []
+    for i in range(len(docs)):
+        if not kept or sims[i, kept].max() < REDUNDANT_SIM:
+            kept.append(i)
+    return [docs[i] for i in kept], vecs[kept]
+
+
+def _rerank_biencoder(qvec, docs: List, doc_vecs) -> List:
+    q = np.asarray(qvec, dtype=np.float32)
+    scores = doc_vecs @ (q / max(float(np.linalg.norm(q)), 1e-12))
+    return [docs[i] for i in np.argsort(-scores, kind="stable")]
+
+
+def _rerank_crossencoder(user_question: str, docs: List) -> List:
+    global _CROSS
+    if _CROSS is None:
+        _CROSS = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+    texts = [getattr(d, "page_content", "") for d in docs]
+    # length-sorted pairs keep padding per batch low; scores are scattered back afterwards
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_scores = _CROSS.predict([(user_question, texts[i]) for i in order], batch_size=32)
+    scores = np.empty(len(docs), dtype=np.float32)
+    scores[order] = sorted_scores
+    return [docs[i] for i in np.argsort(-scores, kind="stable")]
 
 
 def _retrieve_documents(user_question: str) -> List:
@@ -156,34 +411,45 @@ def _retrieve_documents(user_question: str) -> List:
 
     # Multi-query retrieval with diversity
     queries = _expand_queries(user_question)
-    gathered: List = []
-    for q in queries:
-        try:
-            gathered.extend(db.max_marginal_relevance_search(q, k=6, fetch_k=18))
-        except Exception:
-            gathered.extend(db.similarity_search(q, k=6))
+    # one batched embedder call for all query variants instead of one forward pass each
+    qvecs = embeddings.embed_documents(queries)
+    try:
+        gathered, gathered_vecs = _mmr_search_batch(db, qvecs, k=6, fetch_k=18)
+    except Exception:
+        gathered, gathered_vecs = [], None
+        for qvec in qvecs:
+            try:
+                gathered.extend(db.max_marginal_relevance_search_by_vector(qvec, k=6, fetch_k=18))
+            except Exception:
+                gathered.extend(db.similarity_search_by_vector(qvec, k=6))
 
-    # Deduplicate by page content hash to avoid repeats
+    # Exact repeats (the same chunk hit by several query variants) are dropped cheaply first,
+    # then near-duplicates (cosine > REDUNDANT_SIM) using the index vectors (the embedder
+    # only runs for the fallback path above, which has no vectors)
     seen = set()
     docs = []
-    for d in gathered:
-        key = getattr(d, "page_content", str(d))[:256]
+    keep_rows = []
+    for row, d in enumerate(gathered):
+        key = getattr(d, "page_content", str(d))
         if key in seen:
             continue
         seen.add(key)
         docs.append(d)
+        keep_rows.append(row)
+    if gathered_vecs is not None:
+        gathered_vecs = gathered_vecs[keep_rows]
+    docs, doc_vecs = _filter_redundant(docs, embeddings, gathered_vecs)
 
-    # Optional cross-encoder reranking (if available)
-    global _CROSS
-    if CrossEncoder is not None and docs:
-        try:
-            if _CROSS is None:
-                _CROSS = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-            pairs = [(user_question, getattr(d, "page_content", "")) for d in docs]
-            scores = _CROSS.predict(pairs)
-            docs = [d for _, d in sorted(zip(scores, docs), key=lambda x: x[0], reverse=True)]
-        except Exception:
-            pass
+    # Reranking: biencoder reuses the vectors above (a matmul); crossencoder runs a model per pair
+    try:
+        if RERANK_MODE == "biencoder" and doc_vecs is not None:
+            q = (user_question or "").strip()
+            qvec = qvecs[queries.index(q)] if q in queries else embeddings.embed_query(q)
+            docs = _rerank_biencoder(qvec, docs, doc_vecs)
+        elif RERANK_MODE == "crossencoder" and CrossEncoder is not None and docs:
+            docs = _rerank_crossencoder(user_question, docs)
+    except Exception:
+        pass
 
     return docs[:10]
 
@@ -192,43 +458,119 @@ def _normalize_query_for_cache(q: str) -> str:
     return " ".join((q or "").strip().lower().split())
 
 
-@lru_cache(maxsize=128)
 def get_answer_with_sources(user_question: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Cached by the normalized question, so whitespace/case variants share one entry.
+    Entries are tied to the mtime of the index actually loaded (which is reloaded when ingest
+    replaces it), so an answer from the old index is never stored under the new index's key.
+    """
+    try:
+        _load_embeddings_and_index()
+    except Exception:
+        pass  # surfaced by _get_answer_with_sources_impl below
+    key = f"{_DB_MTIME}|{_normalize_query_for_cache(user_question)}"
+    with _ANSWER_CACHE_LOCK:
+        if key in _ANSWER_CACHE:
+            _ANSWER_CACHE.move_to_end(key)
+            return _ANSWER_CACHE[key]
+        if ANSWER_CACHE_PATH:
+            try:
+                with shelve.open(ANSWER_CACHE_PATH, flag="r") as db:
+                    hit = db.get(key)
+            except Exception:
+                hit = None
+            if hit is not None:
+                _ANSWER_CACHE[key] = hit
+                return hit
+
+    result = _get_answer_with_sources_impl(user_question)
+
+    # only cache real answers; errors/quota messages ("⚠ ...") are retried on the next ask
+    if result[0].startswith("⚠"):
+        return result
+    with _ANSWER_CACHE_LOCK:
+        _ANSWER_CACHE[key] = result
+        if len(_ANSWER_CACHE) > _ANSWER_CACHE_MAX:
+            _ANSWER_CACHE.popitem(last=False)
+        if ANSWER_CACHE_PATH:
+            try:
+                with shelve.open(ANSWER_CACHE_PATH) as db:
+                    db[key] = result
+            except Exception as e:
+                log.warning("Could not persist answer cache: %s", e)
+    return result
+
+
+def _ask_gemini(context_text: str, user_question: str) -> str:
+    _ensure_event_loop()  # may run on a hedge worker thread
+    chain = get_conversational_chain()
+    return chain.invoke({"context": context_text, "question": user_question})
+
+
+def _ask_openai(context_text: str, user_question: str) -> str:
+    from openai import OpenAI
+    oai = OpenAI()
+    system_prompt = (
+        "You are a helpful assistant. Answer the user's question using only the given context. "
+        "If the answer is not present, reply exactly: 'answer is not available in the context'."
+    )
+    user_prompt = f"Context:\n{context_text}\n\nQuestion:\n{user_question}\n\nAnswer:"
+    chat = oai.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.3,
+    )
+    return chat.choices[0].message.content.strip()
+
+
+def _ask_hedged(context_text: str, user_question: str) -> str:
+    """
+    Send the question to Gemini and OpenAI at the same time and return the first non-empty answer.
+    Runs on a thread pool (not asyncio.run) because callers may already be inside an event loop.
+    """
+    futures = [_HEDGE_POOL.submit(fn, context_text, user_question) for fn in (_ask_gemini, _ask_openai)]
+    pending = set(futures)
+    first_err = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None and fut.result():
+                for other in pending:
+                    other.cancel()  # best effort; an in-flight HTTP call just finishes in the background
+                return fut.result()
+            first_err = first_err or fut.exception()
+    raise first_err or RuntimeError("No answer generated.")
+
+
+def _get_answer_with_sources_impl(user_question: str) -> Tuple[str, List[Dict[str, Any]]]:
     try:
         docs = _retrieve_documents(user_question)
         if not docs:
             return "⚠ No relevant information found in the knowledge base.", []
 
         sources = _doc_sources(docs)
+        context_text = _format_context(docs)
+
+        # Hedged path (RAG_HEDGE=1): race both providers; costs two LLM calls per question
+        if HEDGE_LLM and GOOGLE_API_KEY and OPENAI_API_KEY:
+            try:
+                return (_ask_hedged(context_text, user_question), sources)
+            except Exception as hedge_err:
+                return (f"⚠ Gemini and OpenAI both failed: {hedge_err}", sources)
 
         # Primary path: Gemini via LangChain
         try:
-            chain = get_conversational_chain()
-            context_text = _format_context(docs)
-            response = chain.invoke({"context": context_text, "question": user_question})
+            response = _ask_gemini(context_text, user_question)
             return (response if response else "⚠ No answer generated.", sources)
         except Exception as gemini_err:
             gemini_msg = str(gemini_err)
             # Quota or missing key → fall back to OpenAI if configured
             if ("429" in gemini_msg or "quota" in gemini_msg.lower() or not GOOGLE_API_KEY) and OPENAI_API_KEY:
                 try:
-                    from openai import OpenAI
-                    oai = OpenAI()
-                    context_text = _format_context(docs)
-                    system_prompt = (
-                        "You are a helpful assistant. Answer the user's question using only the given context. "
-                        "If the answer is not present, reply exactly: 'answer is not available in the context'."
-                    )
-                    user_prompt = f"Context:\n{context_text}\n\nQuestion:\n{user_question}\n\nAnswer:"
-                    chat = oai.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt},
-                        ],
-                        temperature=0.3,
-                    )
-                    return (chat.choices[0].message.content.strip(), sources)
+                    return (_ask_openai(context_text, user_question), sources)
                 except Exception as openai_err:
                     return ("⚠ Gemini unavailable and OpenAI fallback failed: " + str(openai_err), sources)
 
@@ -257,17 +599,18 @@ def translate_text(text: str, target_language_code: str, source_language_code: s
         return text
     try:
         # Keep same call pattern as your original UI
-        translation = client.text.translate(
-            input=text,
-            source_language_code=source_language_code,
-            target_language_code=target_language_code,
-            speaker_gender="Male"
-        )
+        with SARVAM_SLOTS:
+            translation = client.text.translate(
+                input=text,
+                source_language_code=source_language_code,
+                target_language_code=target_language_code,
+                speaker_gender="Male"
+            )
         # translation may be object-like; handle safely
         return getattr(translation, "translated_text", translation if isinstance(translation, str) else str(translation))
     except Exception as e:
         # If translation fails, return original text
-        print("[rag] Translation failed:", e)
+        log.warning("Translation failed: %s", e)
         return text
 
 # -------------------- High-level: answer from transcript --------------------
@@ -291,14 +634,17 @@ def answer_from_transcript(transcript_text: str, target_language_code: str = "en
     if answer_en and not answer_en.startswith("⚠") and target_language_code != "en-IN":
         final_answer = translate_text(answer_en, target_language_code, source_language_code="en-IN")
 
-    # Save answer
+    save_latest_answer(final_answer)
+    return final_answer
+
+
+def save_latest_answer(text: str):
+    """Overwrite transcripts/latest_answer.txt (callers that cache answers use it on hits too)."""
     try:
         with open(LATEST_ANSWER_PATH, "w", encoding="utf-8") as f:
-            f.write(final_answer)
+            f.write(text)
     except Exception as e:
-        print("[rag] Could not save answer:", e)
-
-    return final_answer
+        log.warning("Could not save answer: %s", e)
 
 # CLI for direct usage of rag.py (optional)
 if __name__ == "__main__":
@@ -3,11 +3,18 @@
 stt.py — STT-only (Sarvam) with auto-detect.
 Saves only transcripts/latest_transcript.txt (overwritten).
 Exports: record_and_transcribe(language='auto', seconds=6, save_to=None)
+         record_and_transcribe_stream(...) / transcribe_pcm_stream(blocks) — VAD-segmented streaming
 """
 import os
 import io
+import sys
 import json
-import re
+import logging
+import asyncio
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from hashlib import blake2b
 import numpy as np
 # soundfile is only needed for saving BytesIO audio
 import soundfile as sf
@@ -19,220 +26,368 @@ try:
 except Exception:
     sd = None
 
+# scipy is only needed for STT_RESAMPLE_NATIVE
+try:
+    from scipy.signal import resample_poly
+except Exception:
+    resample_poly = None
+
+# orjson is optional: faster parsing of Sarvam error bodies
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# numba is optional: JIT kernel for per-sample loops (numpy fallback otherwise)
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
+# silero-vad is optional: neural VAD for the streaming pipeline (energy VAD otherwise)
+try:
+    from silero_vad import load_silero_vad
+except Exception:
+    load_silero_vad = None
+
 # Load environment variables (local: .env, Render: injected env vars)
 load_dotenv()
+# Missing key/SDK are reported when transcription is first attempted, so import-only
+# consumers (linters, test collectors, the server at startup) can still load this module
 SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
-if not SARVAM_API_KEY:
-    raise SystemExit("Set SARVAM_API_KEY in environment or .env")
 
 # Sarvam SDK for STT
 try:
     from sarvamai import SarvamAI
 except Exception:
-    raise SystemExit("Install sarvamai SDK: pip install sarvamai")
+    SarvamAI = None
 
 # Config
 DEFAULT_SAMPLE_RATE = 16000
 DEFAULT_CHANNELS = 1
 DEFAULT_RECORD_SECONDS = 6
+# small PortAudio buffers: less fill time before the first samples arrive
+DEFAULT_LATENCY = "low"
+DEFAULT_BLOCKSIZE = 256
+# STT_RESAMPLE_NATIVE=1: record at the device's native rate and resample to 16 kHz ourselves
+# (for devices where PortAudio/the OS resamples poorly); off by default
+RESAMPLE_FROM_NATIVE = os.getenv("STT_RESAMPLE_NATIVE") == "1"
+# STT_TRIM_SILENCE=<amplitude>: drop leading/trailing samples at or below this int16 level (0 = off)
+TRIM_SILENCE_THRESHOLD = int(os.getenv("STT_TRIM_SILENCE", "0"))
 STT_MODEL_NAME = "saarika:v2.5"
+# Container for recorded audio sent to Sarvam: lossless FLAC is ~half the bytes of PCM16 WAV
+# for speech; STT_RECORD_FORMAT=WAV restores the old uploads
+RECORD_FORMAT = "WAV" if os.getenv("STT_RECORD_FORMAT", "FLAC").upper() == "WAV" else "FLAC"
+RECORD_EXT = "." + RECORD_FORMAT.lower()
+# Streaming (VAD-segmented) transcription
+STREAM_BLOCK_FRAMES = 10240        # 640 ms per capture block at 16 kHz
+VAD_WINDOW_FRAMES = 512            # 32 ms analysis window (silero's window size at 16 kHz)
+VAD_SILENCE_MS = int(os.getenv("STT_VAD_SILENCE_MS", "320"))
+VAD_ENERGY_THRESHOLD = float(os.getenv("STT_VAD_ENERGY", "500"))   # int16 RMS
+VAD_MAX_SEGMENT_SECONDS = 15
+
+# Response parsing lives in stt_parse (optionally mypyc-compiled); the package import is
+# used by the server, the bare one when this file is run as a script
+try:
+    from chatbot_sih.src.stt_parse import (ALLOWED_LANG_CODES, SHORTHAND_MAP, _LANG_LOWER, _SHORT_LOWER,
+                                           extract_transcript, extract_detected_language)
+except ImportError:
+    from stt_parse import (ALLOWED_LANG_CODES, SHORTHAND_MAP, _LANG_LOWER, _SHORT_LOWER,
+                           extract_transcript, extract_detected_language)
+
+_JSON_DECODER = json.JSONDecoder()
 
-ALLOWED_LANG_CODES = {
-    "en-IN","hi-IN","bn-IN","kn-IN","ml-IN","mr-IN","od-IN","pa-IN","ta-IN","te-IN","gu-IN","unknown"
-}
-SHORTHAND_MAP = {
-    "en":"en-IN","hi":"hi-IN","bn":"bn-IN","kn":"kn-IN","ml":"ml-IN","mr":"mr-IN",
-    "od":"od-IN","pa":"pa-IN","ta":"ta-IN","te":"te-IN","gu":"gu-IN"
-}
+log = logging.getLogger("stt")
 
 # Transcripts folder (single-file behavior)
 TRANSCRIPTS_DIR = os.path.join(os.getcwd(), "transcripts")
-os.makedirs(TRANSCRIPTS_DIR, exist_ok=True)
+_dir_ready = False
 LATEST_TRANSCRIPT_PATH = os.path.join(TRANSCRIPTS_DIR, "latest_transcript.txt")
+# STT_FSYNC=1 fsyncs the transcript before the atomic rename (durability over speed)
+TRANSCRIPT_FSYNC = os.getenv("STT_FSYNC") == "1"
+
+# Recent Sarvam responses keyed by (audio blake2b, language, model), checked in
+# transcribe_with_sarvam, so double-submitted uploads/segments skip the API call
+_STT_CACHE: "OrderedDict[tuple, object]" = OrderedDict()
+_STT_CACHE_MAX = 128
+_STT_CACHE_LOCK = threading.Lock()
+
+# Process-wide Sarvam budget: at most SARVAM_CONCURRENCY HTTP calls in flight, shared by STT
+# here and rag.translate_text (both run in worker threads), so bursts queue instead of
+# coming back as "Too many requests"
+SARVAM_CONCURRENCY = int(os.getenv("SARVAM_CONCURRENCY", "8"))
+SARVAM_SLOTS = threading.BoundedSemaphore(SARVAM_CONCURRENCY)
+# Async callers queue on the event loop first, so waiting STT requests don't each park a
+# to_thread worker on SARVAM_SLOTS
+SARVAM_SEM = asyncio.Semaphore(SARVAM_CONCURRENCY)
 
 
+# every accepted spelling (full code, shorthand, "auto"), lowercased -> canonical code
+_LANG_LOOKUP = {**_SHORT_LOWER, **_LANG_LOWER, "auto": "unknown"}
+
+
+@lru_cache(maxsize=64)
 def normalize_lang_code(user_input: str) -> str:
     if not user_input:
         return ""
-    u = user_input.strip()
-    if u.lower() == "auto":
-        return "unknown"
-    if u in ALLOWED_LANG_CODES:
-        return u
-    if u in SHORTHAND_MAP:
-        return SHORTHAND_MAP[u]
-    u2 = u.replace("_","-").lower()
-    for code in ALLOWED_LANG_CODES:
-        if code.lower() == u2:
-            return code
-    if u.lower() in SHORTHAND_MAP:
-        return SHORTHAND_MAP[u.lower()]
-    return ""
+    return _LANG_LOOKUP.get(user_input.strip().replace("_", "-").lower(), "")
+
+
+def _preferred_input_device():
+    """On Linux prefer ALSA's default input over PulseAudio/JACK (less buffering); else PortAudio's default."""
+    if sd is None or not sys.platform.startswith("linux"):
+        return None
+    try:
+        for api in sd.query_hostapis():
+            if "alsa" in api.get("name", "").lower() and api.get("default_input_device", -1) >= 0:
+                return api["default_input_device"]
+    except Exception:
+        pass
+    return None
+
+
+# Per-thread reusable BytesIO (and int16 capture buffer) for recordings. It is single-owner: the buffer returned by
+# record_from_mic is overwritten by the next recording on the same thread, so copy
+# (bio.getvalue()) anything that must outlive that.
+_TLS = threading.local()
+
+
+def _scratch_bio() -> io.BytesIO:
+    bio = getattr(_TLS, "bio", None)
+    if bio is None:
+        bio = _TLS.bio = io.BytesIO()
+    bio.seek(0)
+    bio.truncate(0)
+    return bio
+
+
+def _rec_buffer(frames: int, channels: int) -> np.ndarray:
+    """Per-thread int16 capture buffer, grown only when a longer recording is requested."""
+    buf = getattr(_TLS, "rec", None)
+    if buf is None or buf.shape[0] < frames or buf.shape[1] != channels:
+        buf = _TLS.rec = np.empty((frames, channels), dtype=np.int16)
+    return buf[:frames]
+
+
+def _trim_bounds_kernel(buf, thresh):
+    n, ch = buf.shape
+    start = n
+    for i in range(n):
+        for c in range(ch):
+            if abs(np.int32(buf[i, c])) > thresh:
+                start = i
+                break
+        if start != n:
+            break
+    end = start
+    for i in range(n - 1, start - 1, -1):
+        for c in range(ch):
+            if abs(np.int32(buf[i, c])) > thresh:
+                end = i + 1
+                break
+        if end != start:
+            break
+    return start, end
+
+
+def _trim_bounds_numpy(buf, thresh):
+    loud = np.flatnonzero((np.abs(buf.astype(np.int32)) > thresh).any(axis=1))
+    return (int(loud[0]), int(loud[-1]) + 1) if loud.size else (0, 0)
+
+
+# cache=True stores the compiled kernel on disk, so the JIT cost is paid once per install
+_trim_bounds = njit(cache=True, nogil=True)(_trim_bounds_kernel) if njit is not None else _trim_bounds_numpy
+
+
+def _trim_silence(buf: np.ndarray, thresh: int) -> np.ndarray:
+    """Slice off leading/trailing frames with |sample| <= thresh; all-quiet audio is returned as-is."""
+    start, end = _trim_bounds(buf, thresh)
+    return buf[start:end] if end > start else buf
+
+
+def _native_input_rate(device) -> int:
+    info = sd.query_devices(device if device is not None else sd.default.device[0], "input")
+    return int(info["default_samplerate"])
+
+
+def _capture(frames_total, samplerate, channels, latency, device, sink):
+    """Run an input stream and hand each int16 block to sink() until frames_total frames were captured."""
+    captured = 0
+    done = threading.Event()
+
+    def _on_block(indata, frames, time_info, status):
+        nonlocal captured
+        block = indata[:frames_total - captured]
+        sink(block)
+        captured += len(block)
+        if captured >= frames_total:
+            done.set()
+            raise sd.CallbackStop
+
+    with sd.InputStream(samplerate=samplerate, channels=channels, dtype="int16",
+                        blocksize=DEFAULT_BLOCKSIZE, latency=latency,
+                        device=device, callback=_on_block):
+        done.wait(timeout=frames_total / samplerate + 5)
 
 
 def record_from_mic(duration_seconds=DEFAULT_RECORD_SECONDS,
                     samplerate=DEFAULT_SAMPLE_RATE,
-                    channels=DEFAULT_CHANNELS):
+                    channels=DEFAULT_CHANNELS,
+                    latency=DEFAULT_LATENCY,
+                    resample_from_native=RESAMPLE_FROM_NATIVE,
+                    trim_threshold=TRIM_SILENCE_THRESHOLD):
     """
     Record from mic only when sounddevice (PortAudio) is available.
     On servers without PortAudio this raises a clear error — you shouldn't
     call this on Render (server) where uploads are expected instead.
+    The returned BytesIO is reused by the next call on the same thread.
+    With resample_from_native, audio is captured at the device's native rate and
+    resampled to `samplerate` here instead of by the host audio stack.
+    trim_threshold > 0 trims leading/trailing silence before encoding.
     """
     if sd is None:
         raise RuntimeError("sounddevice/PortAudio not available in this environment. "
                            "Use uploaded audio files instead.")
+    device = _preferred_input_device()
+    capture_rate = samplerate
+    if resample_from_native and resample_poly is not None:
+        try:
+            capture_rate = _native_input_rate(device)
+        except Exception:
+            capture_rate = samplerate
+
     print(f"Recording for {duration_seconds}s — speak now...")
-    recording = sd.rec(int(duration_seconds * samplerate),
-                       samplerate=samplerate,
-                       channels=channels,
-                       dtype="int16")
-    sd.wait()
-    audio_np = np.asarray(recording)
-    bio = io.BytesIO()
-    sf.write(bio, audio_np, samplerate, format="WAV", subtype="PCM_16")
+    bio = _scratch_bio()
+    if capture_rate == samplerate and trim_threshold <= 0:
+        # blocks are encoded as they arrive: no full-length numpy buffer + second copy
+        with sf.SoundFile(bio, mode="w", samplerate=samplerate, channels=channels,
+                          format=RECORD_FORMAT, subtype="PCM_16") as wf:
+            _capture(int(duration_seconds * samplerate), samplerate, channels, latency, device, wf.write)
+    else:
+        # blocks land directly in a reused buffer: no per-block copies + concatenate
+        audio = _rec_buffer(int(duration_seconds * capture_rate), channels)
+        filled = 0
+
+        def _into_buffer(block):
+            nonlocal filled
+            audio[filled:filled + len(block)] = block
+            filled += len(block)
+
+        _capture(len(audio), capture_rate, channels, latency, device, _into_buffer)
+        audio = audio[:filled]
+        if trim_threshold > 0 and len(audio):
+            audio = _trim_silence(audio, trim_threshold)
+        if capture_rate != samplerate:
+            audio = resample_poly(audio.astype(np.float32), samplerate, capture_rate, axis=0)
+            audio = np.clip(audio, -32768, 32767).astype(np.int16)
+        sf.write(bio, audio, samplerate, format=RECORD_FORMAT, subtype="PCM_16")
     bio.seek(0)
+    bio.name = "rec" + RECORD_EXT  # the SDK derives the upload filename/type from this
     return bio
 
 
-# STT client
-client = SarvamAI(api_subscription_key=SARVAM_API_KEY)
+# STT client: created once per process on first use, with a keep-alive HTTP session so
+# repeated transcriptions reuse the TLS connection instead of reconnecting each call
+@lru_cache(maxsize=1)
+def _client():
+    try:
+        import httpx
+        http = httpx.Client(limits=httpx.Limits(max_keepalive_connections=8), timeout=60.0)
+        return SarvamAI(api_subscription_key=SARVAM_API_KEY, httpx_client=http)
+    except (ImportError, TypeError):
+        # no httpx, or an SDK version without the httpx_client argument
+        return SarvamAI(api_subscription_key=SARVAM_API_KEY)
+
+
+def _audio_digest(audio_file_like):
+    """
+    blake2b of the audio from its current position (file-like, or the SDK's
+    (name, fileobj, content_type) tuple), read in 64 KiB chunks; the position is restored.
+    None when the object can't be read and rewound.
+    """
+    f = audio_file_like[1] if isinstance(audio_file_like, tuple) else audio_file_like
+    try:
+        pos = f.tell()
+        h = blake2b(digest_size=16)
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+        f.seek(pos)
+        return h.hexdigest()
+    except Exception:
+        return None
 
 
 def transcribe_with_sarvam(audio_file_like, language_code: str = "unknown", model: str = STT_MODEL_NAME):
+    if not SARVAM_API_KEY:
+        raise RuntimeError("Set SARVAM_API_KEY in environment or .env")
+    if SarvamAI is None:
+        raise RuntimeError("Install sarvamai SDK: pip install sarvamai")
+    digest = _audio_digest(audio_file_like)
+    key = (digest, language_code, model)
+    if digest is not None:
+        with _STT_CACHE_LOCK:
+            cached = _STT_CACHE.get(key)
+            if cached is not None:
+                _STT_CACHE.move_to_end(key)
+                return cached
     try:
-        resp = client.speech_to_text.transcribe(
-            file=audio_file_like, model=model, language_code=language_code
-        )
+        with SARVAM_SLOTS:
+            resp = _client().speech_to_text.transcribe(
+                file=audio_file_like, model=model, language_code=language_code
+            )
+        # only responses with a transcript are cached; errors/empty results are retried
+        if digest is not None and extract_transcript(resp):
+            with _STT_CACHE_LOCK:
+                _STT_CACHE[key] = resp
+                if len(_STT_CACHE) > _STT_CACHE_MAX:
+                    _STT_CACHE.popitem(last=False)
         return resp
     except Exception as e:
         err_str = str(e)
         parsed = {"message": err_str}
-        try:
-            jstart = err_str.find("{")
-            if jstart != -1:
-                parsed_json = json.loads(err_str[jstart:])
-                parsed = parsed_json
-        except Exception:
-            pass
+        i = err_str.find("{")
+        # common case: the message ends with the JSON body -> one orjson parse
+        if orjson is not None and i != -1:
+            try:
+                return {"error": orjson.loads(err_str[i:])}
+            except orjson.JSONDecodeError:
+                pass
+        # otherwise the first valid JSON object embedded in the message, parsed in place
+        while i != -1:
+            try:
+                parsed, _ = _JSON_DECODER.raw_decode(err_str, i)
+                break
+            except ValueError:
+                i = err_str.find("{", i + 1)
         return {"error": parsed}
 
 
-def extract_transcript(resp):
-    """Robust extraction of transcript from Sarvam response."""
-    if not resp:
-        return None
-
-    if isinstance(resp, dict) and "error" in resp:
-        return None
-
-    if isinstance(resp, dict):
-        for key in ("transcript", "text", "result", "transcription"):
-            if key in resp and isinstance(resp[key], str) and resp[key].strip():
-                return resp[key].strip()
-        if "data" in resp and isinstance(resp["data"], dict):
-            d = resp["data"]
-            for key in ("transcript", "text", "transcription"):
-                if key in d and isinstance(d[key], str) and d[key].strip():
-                    return d[key].strip()
-        if "alternatives" in resp and isinstance(resp["alternatives"], list) and resp["alternatives"]:
-            alt0 = resp["alternatives"][0]
-            if isinstance(alt0, dict) and "transcript" in alt0 and isinstance(alt0["transcript"], str):
-                return alt0["transcript"].strip()
-
-    if isinstance(resp, str):
-        s = resp.strip()
-        m = re.search(r"transcript\s*=\s*'([^']*)'", s)
-        if m and m.group(1).strip():
-            return m.group(1).strip()
-        m2 = re.search(r'transcript\s*=\s*"([^"]*)"', s)
-        if m2 and m2.group(1).strip():
-            return m2.group(1).strip()
-        idx = s.find("transcript=")
-        if idx != -1:
-            tail = s[idx + len("transcript="):]
-            if tail.startswith("'"):
-                tail = tail[1:]
-                end_idx = tail.find("'")
-                if end_idx != -1:
-                    return tail[:end_idx].strip()
-            elif tail.startswith('"'):
-                tail = tail[1:]
-                end_idx = tail.find('"')
-                if end_idx != -1:
-                    return tail[:end_idx].strip()
-            else:
-                stop_tokens = [" timestamps", " language_code", " diarized_transcript", " request_id"]
-                stop_positions = [tail.find(tok) for tok in stop_tokens if tail.find(tok) != -1]
-                stop = min(stop_positions) if stop_positions else None
-                candidate = tail[:stop].strip() if stop else tail.strip()[:200]
-                if candidate:
-                    return candidate
-
-    try:
-        s = str(resp)
-        m = re.search(r"transcript\s*=\s*'([^']*)'", s)
-        if m and m.group(1).strip():
-            return m.group(1).strip()
-    except Exception:
-        pass
-
-    try:
-        return json.dumps(resp, ensure_ascii=False)
-    except Exception:
-        return None
-
-
-def extract_detected_language(resp):
-    """Extract detected language code from Sarvam response."""
-    if not resp:
-        return None
-
-    def _normalize(code: str):
-        if not code or not isinstance(code, str):
-            return None
-        c = code.strip().replace("_", "-")
-        if c in ALLOWED_LANG_CODES:
-            return c
-        for ac in ALLOWED_LANG_CODES:
-            if ac.lower() == c.lower():
-                return ac
-        if c in SHORTHAND_MAP:
-            return SHORTHAND_MAP[c]
-        if c.lower() in SHORTHAND_MAP:
-            return SHORTHAND_MAP[c.lower()]
-        if re.fullmatch(r"^[a-z]{2}$", c.lower()):
-            cand = SHORTHAND_MAP.get(c.lower(), c.lower() + "-IN")
-            return cand if cand in ALLOWED_LANG_CODES else cand
-        return None
+def _ensure_transcripts_dir():
+    global _dir_ready
+    if not _dir_ready:
+        os.makedirs(TRANSCRIPTS_DIR, exist_ok=True)
+        _dir_ready = True
 
-    if isinstance(resp, dict):
-        for key in ("language_code", "language", "detected_language", "lang", "detectedLang"):
-            if key in resp and isinstance(resp[key], str) and resp[key].strip():
-                return _normalize(resp[key].strip())
-        for parent in ("data", "metadata"):
-            if parent in resp and isinstance(resp[parent], dict):
-                for key in ("language_code", "language", "detected_language", "lang", "detectedLang"):
-                    if key in resp[parent] and isinstance(resp[parent][key], str) and resp[parent][key].strip():
-                        return _normalize(resp[parent][key].strip())
-        if "alternatives" in resp and isinstance(resp["alternatives"], list):
-            for alt in resp["alternatives"]:
-                if isinstance(alt, dict):
-                    for key in ("language_code", "language", "detected_language", "lang", "detectedLang"):
-                        if key in alt and isinstance(alt[key], str) and alt[key].strip():
-                            return _normalize(alt[key].strip())
 
+def _write_if_changed(path: str, text: str):
+    """Atomically replace path with text (temp file + os.replace); no-op if the content is unchanged."""
     try:
-        s = resp if isinstance(resp, str) else str(resp)
-        m = re.search(r"(?:language_code|language|detected_language|lang)\s*=\s*['\"]?([a-z]{2}(?:-[A-Za-z]{2})?)['\"]?", s)
-        if m:
-            return _normalize(m.group(1))
-    except Exception:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == text:
+                return
+    except OSError:
         pass
-
-    return None
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        if TRANSCRIPT_FSYNC:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
 
 
-def record_and_transcribe(language: str = "auto", seconds: int = DEFAULT_RECORD_SECONDS, model: str = STT_MODEL_NAME, save_to: str = None):
+def record_and_transcribe(language: str = "auto", seconds: int = DEFAULT_RECORD_SECONDS, model: str = STT_MODEL_NAME, save_to: str = None,
+                          latency=DEFAULT_LATENCY):
     """
     Record from mic (if available), transcribe and return (transcript, detected_language).
     On Render, you should not call this — instead upload audio and call transcribe_with_sarvam directly.
@@ -241,26 +396,244 @@ def record_and_transcribe(language: str = "auto", seconds: int = DEFAULT_RECORD_
     if language.lower() == "auto":
         normalized = "unknown"
 
-    audio = record_from_mic(duration_seconds=seconds)
-    audio.seek(0)
+    audio = record_from_mic(duration_seconds=seconds, latency=latency)
     resp = transcribe_with_sarvam(audio, language_code=normalized, model=model)
 
     transcript = extract_transcript(resp)
     detected_lang = extract_detected_language(resp)
 
     if not transcript:
-        print("No transcript returned by Sarvam. Raw response:", resp)
+        log.warning("No transcript returned by Sarvam")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Raw response: %r", resp)
         return None, detected_lang
 
     try:
-        with open(save_to or LATEST_TRANSCRIPT_PATH, "w", encoding="utf-8") as f:
-            f.write(transcript)
+        if not save_to:
+            _ensure_transcripts_dir()
+        _write_if_changed(save_to or LATEST_TRANSCRIPT_PATH, transcript)
     except Exception as e:
-        print("Warning: could not save transcript:", e)
+        log.warning("Could not save transcript: %s", e)
 
     return transcript, detected_lang
 
 
+# -------------------- Async wrappers (for FastAPI / asyncio callers) --------------------
+async def transcribe_with_sarvam_async(audio_file_like, language_code: str = "unknown", model: str = STT_MODEL_NAME):
+    """transcribe_with_sarvam in a worker thread so the event loop isn't blocked during the HTTP call."""
+    async with SARVAM_SEM:
+        return await asyncio.to_thread(transcribe_with_sarvam, audio_file_like, language_code, model)
+
+
+# older name
+atranscribe_with_sarvam = transcribe_with_sarvam_async
+
+
+async def arecord_and_transcribe(language: str = "auto", seconds: int = DEFAULT_RECORD_SECONDS, model: str = STT_MODEL_NAME,
+                                 save_to: str = None, latency=DEFAULT_LATENCY):
+    """record_and_transcribe (mic capture + STT) on the default executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(record_and_transcribe, language=language, seconds=seconds,
+                                                    model=model, save_to=save_to, latency=latency))
+
+
+# -------------------- Streaming: VAD-segmented transcription --------------------
+# silero-vad keeps recurrent state between calls, so a model is never shared by two live
+# streams: each segmenter borrows one (reset) from this pool and returns it on close()
+_SILERO_POOL = []
+_SILERO_POOL_LOCK = threading.Lock()
+
+
+def _acquire_silero():
+    if load_silero_vad is None:
+        return None
+    with _SILERO_POOL_LOCK:
+        if _SILERO_POOL:
+            return _SILERO_POOL.pop()
+    return load_silero_vad()
+
+
+def _release_silero(model):
+    model.reset_states()
+    with _SILERO_POOL_LOCK:
+        _SILERO_POOL.append(model)
+
+
+class VadSegmenter:
+    """
+    Cut a stream of int16 blocks into utterances: a segment ends after VAD_SILENCE_MS of
+    non-speech following speech, or at VAD_MAX_SEGMENT_SECONDS. Uses silero-vad when it is
+    installed (16 kHz only), else an RMS energy gate.
+    """
+
+    def __init__(self, samplerate=DEFAULT_SAMPLE_RATE, silence_ms=VAD_SILENCE_MS,
+                 energy_threshold=VAD_ENERGY_THRESHOLD, max_seconds=VAD_MAX_SEGMENT_SECONDS):
+        self.samplerate = samplerate
+        self.energy_threshold = energy_threshold
+        self.silence_windows = max(1, int(silence_ms * samplerate / 1000) // VAD_WINDOW_FRAMES)
+        self.max_frames = int(max_seconds * samplerate)
+        self._model = _acquire_silero() if samplerate == 16000 else None
+        self._pending = np.zeros(0, dtype=np.int16)   # samples not yet forming a full window
+        self._windows = []
+        self._voiced = False
+        self._silent_run = 0
+
+    def _is_speech(self, win: np.ndarray) -> bool:
+        if self._model is not None:
+            import torch
+            x = torch.from_numpy(win.astype(np.float32) / 32768.0)
+            return self._model(x, self.samplerate).item() >= 0.5
+        return float(np.sqrt(np.mean(win.astype(np.float32) ** 2))) >= self.energy_threshold
+
+    def feed(self, block: np.ndarray) -> list:
+        """Add a block (mono, or first channel is used); return any completed segments."""
+        block = block[:, 0] if block.ndim == 2 else block
+        buf = np.concatenate((self._pending, block)) if self._pending.size else block
+        n_full = len(buf) // VAD_WINDOW_FRAMES * VAD_WINDOW_FRAMES
+        self._pending = buf[n_full:].copy()
+
+        segments = []
+        for i in range(0, n_full, VAD_WINDOW_FRAMES):
+            win = buf[i:i + VAD_WINDOW_FRAMES]
+            if self._is_speech(win):
+                self._voiced = True
+                self._silent_run = 0
+            elif self._voiced:
+                self._silent_run += 1
+            else:
+                continue  # leading silence is dropped
+            self._windows.append(win.copy())
+            if (self._silent_run >= self.silence_windows
+                    or len(self._windows) * VAD_WINDOW_FRAMES >= self.max_frames):
+                segments.append(self._cut())
+        return segments
+
+    def _cut(self) -> np.ndarray:
+        seg = np.concatenate(self._windows)
+        self._windows = []
+        self._voiced = False
+        self._silent_run = 0
+        return seg
+
+    def close(self):
+        """Hand the silero model back to the pool (reset); the segmenter falls back to energy VAD after this."""
+        if self._model is not None:
+            model, self._model = self._model, None
+            _release_silero(model)
+
+    def flush(self):
+        """Return the trailing voiced segment (if any) at end of stream."""
+        if self._pending.size and self._voiced:
+            self._windows.append(self._pending)
+        self._pending = np.zeros(0, dtype=np.int16)
+        return self._cut() if self._voiced and self._windows else None
+
+
+def _encode_segment(pcm: np.ndarray, samplerate: int) -> io.BytesIO:
+    bio = io.BytesIO()
+    sf.write(bio, pcm, samplerate, format=RECORD_FORMAT, subtype="PCM_16")
+    bio.seek(0)
+    bio.name = "segment" + RECORD_EXT
+    return bio
+
+
+async def _transcribe_segment(pcm, samplerate, language_code, model):
+    resp = await transcribe_with_sarvam_async(_encode_segment(pcm, samplerate), language_code, model)
+    return extract_transcript(resp), extract_detected_language(resp)
+
+
+async def transcribe_pcm_stream(blocks, samplerate: int = DEFAULT_SAMPLE_RATE, language: str = "auto",
+                                model: str = STT_MODEL_NAME):
+    """
+    Async generator: consume an async iterator of int16 blocks, cut utterances with VadSegmenter
+    and yield {"type": "partial", "transcript", "detected_language"} per segment, in order, then
+    a single {"type": "final", ...} with the joined transcript. Segments are sent to Sarvam as soon
+    as they are cut, so STT of one utterance overlaps with capture of the next.
+    """
+    lang = "unknown" if language.lower() == "auto" else (normalize_lang_code(language) or "unknown")
+    seg = VadSegmenter(samplerate)
+    inflight = []   # transcription tasks in segment order
+    parts, detected = [], None
+
+    def _partial(result):
+        nonlocal detected
+        text, d = result
+        detected = detected or d
+        if text:
+            parts.append(text)
+        return {"type": "partial", "transcript": text, "detected_language": d}
+
+    source = blocks.__aiter__()
+
+    async def _next_block():
+        try:
+            return await source.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    pending_block = None
+    try:
+        # wait on the next audio block and the oldest in-flight segment together, so a
+        # partial goes out as soon as its STT finishes even while the client sends nothing
+        while True:
+            if pending_block is None:
+                pending_block = asyncio.ensure_future(_next_block())
+            await asyncio.wait([pending_block] + inflight[:1], return_when=asyncio.FIRST_COMPLETED)
+            while inflight and inflight[0].done():
+                yield _partial(inflight.pop(0).result())
+            if not pending_block.done():
+                continue
+            block, pending_block = pending_block.result(), None
+            if block is None:
+                break
+            for pcm in seg.feed(block):
+                inflight.append(asyncio.create_task(_transcribe_segment(pcm, samplerate, lang, model)))
+
+        tail = seg.flush()
+        if tail is not None:
+            inflight.append(asyncio.create_task(_transcribe_segment(tail, samplerate, lang, model)))
+        while inflight:
+            yield _partial(await inflight.pop(0))
+        yield {"type": "final", "transcript": " ".join(parts), "detected_language": detected}
+    finally:
+        # a failed segment, a client disconnect or an abandoned generator: don't leave
+        # Sarvam calls (or a pending read) running for nobody
+        if pending_block is not None:
+            pending_block.cancel()
+        for task in inflight:
+            task.cancel()
+        seg.close()
+
+
+async def record_and_transcribe_stream(language: str = "auto", seconds: float = 30, model: str = STT_MODEL_NAME,
+                                       samplerate: int = DEFAULT_SAMPLE_RATE, stop_event: asyncio.Event = None):
+    """
+    Streaming counterpart of record_and_transcribe: capture from the mic in 640 ms blocks for up to
+    `seconds` (or until stop_event is set) and yield partial/final events as in transcribe_pcm_stream.
+    """
+    if sd is None:
+        raise RuntimeError("sounddevice/PortAudio not available in this environment. "
+                           "Use uploaded audio files instead.")
+    loop = asyncio.get_running_loop()
+    q: asyncio.Queue = asyncio.Queue()
+
+    def _on_block(indata, frames, time_info, status):
+        loop.call_soon_threadsafe(q.put_nowait, indata.copy())
+
+    async def _mic_blocks():
+        deadline = loop.time() + seconds
+        with sd.InputStream(samplerate=samplerate, channels=1, dtype="int16", blocksize=STREAM_BLOCK_FRAMES,
+                            latency=DEFAULT_LATENCY, device=_preferred_input_device(), callback=_on_block):
+            while loop.time() < deadline and not (stop_event and stop_event.is_set()):
+                try:
+                    yield await asyncio.wait_for(q.get(), timeout=0.1)
+                except asyncio.TimeoutError:
+                    continue
+
+    async for event in transcribe_pcm_stream(_mic_blocks(), samplerate, language, model):
+        yield event
+
+
 if __name__ == "__main__":
     lang = input("Language (en/hi/auto) [default auto]: ").strip() or "auto"
     try:
@@ -0,0 +1,159 @@
+"""
+stt_parse.py — pure parsing helpers for Sarvam STT responses (transcript / detected language).
+No I/O and no third-party imports, so the module can be compiled in place with mypyc
+(`mypyc chatbot_sih/src/stt_parse.py`); the built extension then shadows this file and stt.py
+picks it up with no code change. Without a build the plain-Python module is used.
+"""
+import re
+import sys
+import types
+from functools import lru_cache
+from typing import Any, Optional
+
+# read-only lookup tables (frozen, with interned strings)
+ALLOWED_LANG_CODES = frozenset(sys.intern(c) for c in (
+    "en-IN","hi-IN","bn-IN","kn-IN","ml-IN","mr-IN","od-IN","pa-IN","ta-IN","te-IN","gu-IN","unknown"
+))
+SHORTHAND_MAP = types.MappingProxyType({sys.intern(k): sys.intern(v) for k, v in {
+    "en":"en-IN","hi":"hi-IN","bn":"bn-IN","kn":"kn-IN","ml":"ml-IN","mr":"mr-IN",
+    "od":"od-IN","pa":"pa-IN","ta":"ta-IN","te":"te-IN","gu":"gu-IN"
+}.items()})
+# case-insensitive lookup tables (one dict hit instead of scanning ALLOWED_LANG_CODES)
+_LANG_LOWER = {c.lower(): c for c in ALLOWED_LANG_CODES}
+_SHORT_LOWER = {k.lower(): v for k, v in SHORTHAND_MAP.items()}
+
+# Response keys checked by the extractors, in priority order
+_TRANS_KEYS = ("transcript", "text", "result", "transcription")
+_DATA_TRANS_KEYS = ("transcript", "text", "transcription")
+_LANG_KEYS = ("language_code", "language", "detected_language", "lang", "detectedLang")
+
+# Precompiled patterns for the response extractors
+_RE_TRANSCRIPT_SQ = re.compile(r"transcript\s*=\s*'([^']*)'")
+_RE_TRANSCRIPT_DQ = re.compile(r'transcript\s*=\s*"([^"]*)"')
+_RE_LANG = re.compile(r"(?:language_code|language|detected_language|lang)\s*=\s*['\"]?([a-z]{2}(?:-[A-Za-z]{2})?)['\"]?")
+_RE_BARE2 = re.compile(r"^[a-z]{2}$")
+# transcript=<'quoted'|"quoted"|unquoted up to the next known field> in a single scan
+_RE_TRANSCRIPT_TAIL = re.compile(
+    r"transcript=(?:'([^']*)'|\"([^\"]*)\"|(?!['\"])(.*?)(?= (?:timestamps|language_code|diarized_transcript|request_id)|$))",
+    re.DOTALL)
+
+
+def _first_str(d: dict, keys: tuple) -> Optional[str]:
+    """First non-blank string value among keys (stripped), else None."""
+    return next((d[k].strip() for k in keys if isinstance(d.get(k), str) and d[k].strip()), None)
+
+
+def extract_transcript(resp: Any) -> Optional[str]:
+    """Robust extraction of transcript from Sarvam response."""
+    if not resp:
+        return None
+
+    if isinstance(resp, dict) and "error" in resp:
+        return None
+
+    if isinstance(resp, dict):
+        val = _first_str(resp, _TRANS_KEYS)
+        if val:
+            return val
+        if "data" in resp and isinstance(resp["data"], dict):
+            val = _first_str(resp["data"], _DATA_TRANS_KEYS)
+            if val:
+                return val
+        if "alternatives" in resp and isinstance(resp["alternatives"], list) and resp["alternatives"]:
+            alt0 = resp["alternatives"][0]
+            if isinstance(alt0, dict) and "transcript" in alt0 and isinstance(alt0["transcript"], str):
+                return alt0["transcript"].strip()
+
+    if isinstance(resp, str):
+        s = resp.strip()
+        # one str.find rejects strings with no transcript field before any regex runs
+        # (the later str(resp) fallback would scan the same string, so bail out here)
+        idx = s.find("transcript")
+        if idx == -1:
+            return None
+        m = _RE_TRANSCRIPT_SQ.search(s, idx)
+        if m and m.group(1).strip():
+            return m.group(1).strip()
+        m2 = _RE_TRANSCRIPT_DQ.search(s, idx)
+        if m2 and m2.group(1).strip():
+            return m2.group(1).strip()
+        m3 = _RE_TRANSCRIPT_TAIL.search(s, idx)
+        if m3:
+            if m3.group(3) is None:
+                return (m3.group(1) if m3.group(1) is not None else m3.group(2)).strip()
+            candidate = m3.group(3).strip()
+            if m3.end(3) == len(s):  # no following field: cap the unquoted value
+                candidate = candidate[:200]
+            if candidate:
+                return candidate
+
+    # SDK response objects (pydantic models) expose the transcript as an attribute
+    if not isinstance(resp, (str, dict)):
+        for attr in ("transcript", "text"):
+            v = getattr(resp, attr, None)
+            if isinstance(v, str) and v.strip():
+                return v.strip()
+
+    try:
+        s = str(resp)
+        m = _RE_TRANSCRIPT_SQ.search(s)
+        if m and m.group(1).strip():
+            return m.group(1).strip()
+    except Exception:
+        pass
+
+    # no transcript found: None, rather than a serialized dump of the whole response
+    return None
+
+
+@lru_cache(maxsize=64)
+def _normalize(code: str) -> Optional[str]:
+    """Map a language code from a Sarvam response to the canonical xx-IN form."""
+    if not code or not isinstance(code, str):
+        return None
+    c = code.strip().replace("_", "-")
+    if c in ALLOWED_LANG_CODES:
+        return c
+    cl = c.lower()
+    hit = _LANG_LOWER.get(cl) or _SHORT_LOWER.get(cl)
+    if hit:
+        return hit
+    if _RE_BARE2.fullmatch(cl):
+        return cl + "-IN"
+    return None
+
+
+def extract_detected_language(resp: Any) -> Optional[str]:
+    """Extract detected language code from Sarvam response."""
+    if not resp:
+        return None
+
+    if isinstance(resp, str):
+        m = _RE_LANG.search(resp)
+        return _normalize(m.group(1)) if m else None
+
+    if isinstance(resp, dict):
+        val = _first_str(resp, _LANG_KEYS)
+        if val:
+            return _normalize(val)
+        for parent in ("data", "metadata"):
+            if isinstance(resp.get(parent), dict):
+                val = _first_str(resp[parent], _LANG_KEYS)
+                if val:
+                    return _normalize(val)
+        if isinstance(resp.get("alternatives"), list):
+            for alt in resp["alternatives"]:
+                if isinstance(alt, dict):
+                    val = _first_str(alt, _LANG_KEYS)
+                    if val:
+                        return _normalize(val)
+
+    try:
+        s = str(resp)
+        m = _RE_LANG.search(s)
+        if m:
+            return _normalize(m.group(1))
+    except Exception:
+        pass
+
+    return None
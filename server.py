@@ -1,31 +1,74 @@
 # server.py
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
-import tempfile
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.websockets import WebSocketState
+import asyncio
+import hashlib
+import logging
+import logging.handlers
+import queue
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
 import uvicorn
 import os
+import re
+import secrets
 from dotenv import load_dotenv
 
 # Use the actual helper functions from your modules
 from chatbot_sih.src import stt as stt_module
 from chatbot_sih.src import rag as rag_module
 
-app = FastAPI()
+# orjson (in requirements) serializes responses: faster than stdlib json and emits UTF-8
+# directly, which matters for the Devanagari/Tamil/etc. transcripts and answers
+app = FastAPI(default_response_class=ORJSONResponse)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # load environment variables (keeps same behavior as your project)
 load_dotenv(dotenv_path=os.path.join(BASE_DIR, "chatbot_sih", ".env"))
 
+# Signed-cookie session: remembers each client's detected language so later recordings are
+# sent with that code instead of "unknown" (skips Sarvam's language ID). Without
+# SESSION_SECRET_KEY a per-process key is used, which only resets the cached language.
+app.add_middleware(SessionMiddleware,
+                   secret_key=os.getenv("SESSION_SECRET_KEY") or secrets.token_urlsafe(32),
+                   same_site="lax")
+
 # === Mount static folders ===
 app.mount("/css", StaticFiles(directory=os.path.join(BASE_DIR, "css")), name="css")
 app.mount("/js", StaticFiles(directory=os.path.join(BASE_DIR, "js")), name="js")
 app.mount("/img", StaticFiles(directory=os.path.join(BASE_DIR, "img")), name="img")
 app.mount("/html", StaticFiles(directory=os.path.join(BASE_DIR, "html")), name="html")
 
-# simple logger helper
-def _log(msg: str):
-    print(f"[server] {msg}")
+# === Logging ===
+# Handlers on the request path only enqueue records; a QueueListener thread formats and
+# writes them to stderr, so slow stdout/stderr never blocks the event loop.
+# LOG_LEVEL=DEBUG also logs raw Sarvam responses.
+_log_queue = queue.SimpleQueue()
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+# the QueueHandler only merges args into the message; the listener's handler adds the prefix
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s",
+                    handlers=[logging.handlers.QueueHandler(_log_queue)], force=True)
+_log_listener.start()
+logger = logging.getLogger("server")
+
+@app.on_event("shutdown")
+def _stop_log_listener():
+    _log_listener.stop()
+
+# === Page table: html/ is scanned once at startup ===
+# Handlers do a dict lookup instead of a stat() per request, and only files that exist
+# in html/ can be served (no path built from user input).
+_HTML_DIR = os.path.join(BASE_DIR, "html")
+_PAGES = {os.path.splitext(f)[0]: os.path.join(_HTML_DIR, f)
+          for f in os.listdir(_HTML_DIR) if f.endswith(".html")}
+# Default to index1.html (your actual front page); fall back to index2 / index
+_HOMEPAGE = next((n for n in ("index1", "index2", "index") if n in _PAGES), None)
 
 # === Index route (serve main html) ===
 @app.get("/")
@@ -34,13 +77,9 @@ async def index():
     Serve the main UI. Default to index1.html (your actual front page).
     Falls back to index2.html and index.html if index1 is missing.
     """
-    try_names = ("index1.html", "index2.html", "index.html")
-    for fname in try_names:
-        fp = os.path.join(BASE_DIR, "html", fname)
-        if os.path.exists(fp):
-            _log(f"Serving homepage file: html/{fname}")
-            return FileResponse(fp)
-    _log("No homepage file found under html/ (tried index1, index2, index).")
+    if _HOMEPAGE:
+        return FileResponse(_PAGES[_HOMEPAGE])
+    logger.warning("No homepage file found under html/ (tried index1, index2, index).")
     raise HTTPException(status_code=404, detail="Main page not found")
 
 # === Dynamic page route ===
@@ -50,13 +89,10 @@ async def serve_page(page_name: str):
     Serve pages from html/<page_name>.html.
     Accepts both /mba and /mba.html requests.
     """
-    if page_name.endswith(".html"):
-        page_name = page_name[:-5]
-    file_path = os.path.join(BASE_DIR, "html", f"{page_name}.html")
-    if os.path.exists(file_path):
-        _log(f"Serving page: html/{page_name}.html")
-        return FileResponse(file_path)
-    _log(f"Page not found requested: {page_name}")
+    fp = _PAGES.get(page_name.removesuffix(".html"))
+    if fp:
+        return FileResponse(fp)
+    logger.info("Page not found requested: %s", page_name)
     raise HTTPException(status_code=404, detail="Page not found")
 
 # === Keyword → page mapping ===
@@ -71,73 +107,223 @@ KEYWORD_ROUTES = {
     "courses": "index3.html"
 }
 
+_KEYWORD_SET = frozenset(KEYWORD_ROUTES)
+# explicit plural -> keyword. Blindly stripping "s" would turn Hinglish "bas" into "ba" and
+# "mas" into "ma", so only keywords longer than two letters get a plural form
+_PLURALS = {k + "s": k for k in KEYWORD_ROUTES if len(k) > 2 and not k.endswith("s")}
+_WORD_RE = re.compile(r"[a-z]+")
+
+@lru_cache(maxsize=512)
 def check_keywords_and_redirect(query: str):
     """
-    Check if query contains any keyword and return a canonical redirect URL.
-    Returns e.g. "/mba" (NOT "/mba.html").
+    Check if query contains any keyword as a whole word and return a canonical redirect URL.
+    Returns e.g. "/mba" (NOT "/mba.html"). Whole words only, so "ma" no longer
+    matches inside "format"/"grammar"; simple plurals ("scholarships") still match.
     """
-    q_lower = (query or "").lower()
-    for key, page in KEYWORD_ROUTES.items():
-        if key in q_lower:
-            return f"/{page.replace('.html', '')}"
-    return None
+    tokens = {_PLURALS.get(t, t) for t in _WORD_RE.findall((query or "").lower())}
+    hit = tokens & _KEYWORD_SET
+    if not hit:
+        return None
+    # keep KEYWORD_ROUTES order as the priority when several keywords appear
+    key = next(k for k in KEYWORD_ROUTES if k in hit)
+    return f"/{KEYWORD_ROUTES[key].replace('.html', '')}"
+
+# === Answer cache for transcript questions ===
+# Voice UIs repeat a handful of utterances ("scholarship", "courses", ...). Answers (incl.
+# translation) are cached by md5(index mtime | normalized transcript | language), so
+# re-running ingest invalidates them like rag's own cache; only touched from the event
+# loop, so no lock is needed.
+_ANSWER_CACHE = OrderedDict()
+_ANSWER_CACHE_MAX = 512
+
+def _answer_cache_key(transcript: str, lang: str) -> str:
+    norm = " ".join((transcript or "").strip().lower().split())
+    return hashlib.md5(f"{rag_module._index_mtime()}|{norm}|{lang}".encode("utf-8")).hexdigest()
+
+async def _cached_answer(transcript: str, lang: str) -> str:
+    key = _answer_cache_key(transcript, lang)
+    if key in _ANSWER_CACHE:
+        _ANSWER_CACHE.move_to_end(key)
+        answer = _ANSWER_CACHE[key]
+        # keep transcripts/latest_answer.txt current, as answer_from_transcript would
+        await asyncio.to_thread(rag_module.save_latest_answer, answer)
+        return answer
+    # RAG + LLM are blocking; run them off the event loop (rag bounds its own Sarvam translate calls)
+    answer = await asyncio.to_thread(rag_module.answer_from_transcript, transcript,
+                                     target_language_code=lang)
+    if answer and not answer.startswith("⚠"):
+        _ANSWER_CACHE[key] = answer
+        if len(_ANSWER_CACHE) > _ANSWER_CACHE_MAX:
+            _ANSWER_CACHE.popitem(last=False)
+    return answer
+
+def _answer_lang(reported_lang, session_lang: str) -> str:
+    """Language to answer in: what Sarvam reported, else the session's pinned code, else en-IN."""
+    return reported_lang or (session_lang if session_lang not in ("unknown", "auto") else "en-IN")
+
+def _remember_lang(request: Request, transcript, detected_lang):
+    """Pin the session to the language Sarvam reported; an empty transcript drops the pin (user may have switched)."""
+    if not transcript:
+        request.session.pop("lang", None)
+    elif detected_lang in stt_module.ALLOWED_LANG_CODES and detected_lang != "unknown":
+        # only codes Sarvam accepts: _normalize maps any bare "xx" to "xx-IN", and pinning
+        # such a code would make every later request from this client fail
+        request.session["lang"] = detected_lang
+
+async def _as_sdk_upload(file: UploadFile):
+    """
+    Hand the spooled upload straight to the SDK as (filename, fileobj, content_type):
+    no temp file, and no extra in-memory copy of the audio.
+    """
+    suffix = os.path.splitext(file.filename or "upload")[1] or ".webm"
+    await file.seek(0)
+    return (f"upload{suffix}", file.file, file.content_type)
 
 # === Transcribe audio endpoint (STT + RAG) ===
 @app.post("/record_and_transcribe/")
-async def record_and_transcribe_endpoint(file: UploadFile = File(...)):
+async def record_and_transcribe_endpoint(request: Request, file: UploadFile = File(...)):
     try:
-        contents = await file.read()
-        suffix = os.path.splitext(file.filename or "upload")[1] or ".webm"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
-
-        with open(tmp_path, "rb") as fh:
-            sarvam_resp = stt_module.transcribe_with_sarvam(fh, language_code="unknown")
+        session_lang = request.session.get("lang", "unknown")
+        sarvam_resp = await stt_module.transcribe_with_sarvam_async(await _as_sdk_upload(file),
+                                                                    language_code=session_lang)
 
         transcript = stt_module.extract_transcript(sarvam_resp)
-        detected_lang = stt_module.extract_detected_language(sarvam_resp) or "en-IN"
+        reported_lang = stt_module.extract_detected_language(sarvam_resp)
+        _remember_lang(request, transcript, reported_lang)
+        detected_lang = _answer_lang(reported_lang, session_lang)
 
         if not transcript:
-            os.remove(tmp_path)
-            return JSONResponse({"error": "No transcript returned by STT", "raw": str(sarvam_resp)})
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("No transcript; Sarvam raw response: %r", sarvam_resp)
+            return ORJSONResponse({"error": "No transcript returned by STT", "raw": str(sarvam_resp)})
 
-        final_answer = rag_module.answer_from_transcript(transcript, target_language_code=detected_lang)
-        os.remove(tmp_path)
+        final_answer = await _cached_answer(transcript, detected_lang)
 
         redirect_url = check_keywords_and_redirect(transcript)
         if redirect_url:
-            return JSONResponse({
+            return ORJSONResponse({
                 "transcript": transcript,
                 "answer": final_answer,
                 "redirect": redirect_url,
                 "detected_language": detected_lang
             })
 
-        return JSONResponse({
+        return ORJSONResponse({
             "transcript": transcript,
             "answer": final_answer,
             "detected_language": detected_lang
         })
     except Exception as e:
-        _log(f"Error in record_and_transcribe: {e}")
-        return JSONResponse({"error": str(e)})
+        logger.error("Error in record_and_transcribe: %s", e)
+        return ORJSONResponse({"error": str(e)})
+
+# === Batch transcribe (segmented recordings, STT calls run concurrently) ===
+@app.post("/record_and_transcribe_batch/")
+async def record_and_transcribe_batch(request: Request, files: list[UploadFile] = File(...)):
+    """
+    Transcribe several audio segments of one utterance in parallel and answer the
+    transcripts joined in upload order. Failed segments are reported per index.
+    """
+    try:
+        session_lang = request.session.get("lang", "unknown")
+        uploads = [await _as_sdk_upload(f) for f in files]
+        results = await asyncio.gather(
+            *(stt_module.transcribe_with_sarvam_async(u, language_code=session_lang) for u in uploads),
+            return_exceptions=True)
+
+        parts, errors, detected_lang = [], [], None
+        for i, resp in enumerate(results):
+            text = None if isinstance(resp, Exception) else stt_module.extract_transcript(resp)
+            if not text:
+                errors.append({"index": i, "error": str(resp) if isinstance(resp, Exception) else "No transcript"})
+                continue
+            parts.append(text)
+            detected_lang = detected_lang or stt_module.extract_detected_language(resp)
+        _remember_lang(request, parts, detected_lang)
+        detected_lang = _answer_lang(detected_lang, session_lang)
+
+        if not parts:
+            return ORJSONResponse({"error": "No transcript returned by STT", "segments": errors})
+
+        transcript = " ".join(parts)
+        payload = {
+            "transcript": transcript,
+            "answer": await _cached_answer(transcript, detected_lang),
+            "detected_language": detected_lang
+        }
+        redirect_url = check_keywords_and_redirect(transcript)
+        if redirect_url:
+            payload["redirect"] = redirect_url
+        if errors:
+            payload["segment_errors"] = errors
+        return ORJSONResponse(payload)
+    except Exception as e:
+        logger.error("Error in record_and_transcribe_batch: %s", e)
+        return ORJSONResponse({"error": str(e)})
+
+# === Streaming transcription (WebSocket) ===
+@app.websocket("/ws/transcribe")
+async def transcribe_stream_ws(ws: WebSocket):
+    """
+    Client sends binary frames of raw PCM16 little-endian mono audio at 16 kHz and a text
+    frame "end" when done. Server replies with {"type": "partial"} JSON per VAD segment as
+    each one is transcribed, then {"type": "final"} with the answer (and redirect, if any).
+    """
+    await ws.accept()
+
+    async def _client_blocks():
+        while True:
+            msg = await ws.receive()
+            if msg.get("type") == "websocket.disconnect":
+                # stop the whole pipeline: no flush, no RAG answer for a client that is gone
+                raise WebSocketDisconnect(msg.get("code", 1000))
+            if msg.get("bytes"):
+                yield np.frombuffer(msg["bytes"], dtype="<i2")
+            elif msg.get("text") == "end":
+                return
+
+    try:
+        # the handshake can't set cookies, so the session language is read-only here
+        language = ws.session.get("lang", "auto")
+        async for event in stt_module.transcribe_pcm_stream(_client_blocks(), language=language):
+            if event["type"] == "final":
+                transcript = event["transcript"]
+                lang = _answer_lang(event["detected_language"], language)
+                if transcript:
+                    event["answer"] = await _cached_answer(transcript, lang)
+                    redirect_url = check_keywords_and_redirect(transcript)
+                    if redirect_url:
+                        event["redirect"] = redirect_url
+                else:
+                    event["error"] = "No transcript returned by STT"
+            await ws.send_json(event)
+        await ws.close()
+    except WebSocketDisconnect:
+        logger.info("transcribe stream: client disconnected")
+    except Exception as e:
+        logger.error("Error in transcribe stream: %s", e)
+        if ws.client_state == WebSocketState.CONNECTED:
+            try:
+                await ws.send_json({"type": "error", "error": str(e)})
+                await ws.close()
+            except (WebSocketDisconnect, RuntimeError):
+                pass  # client went away while we were reporting the error
 
 # === Chatbot endpoint (RAG-only route) ===
 @app.post("/ask_bot/")
 async def ask_bot(query: str = Form(...)):
     try:
-        _log(f"[ask_bot] Query: {query}")
-        answer = rag_module.get_answer(query)
+        logger.info("[ask_bot] Query: %s", query)
+        answer = await asyncio.to_thread(rag_module.get_answer, query)
 
         redirect_url = check_keywords_and_redirect(query)
         if redirect_url:
-            return JSONResponse({"answer": answer, "redirect": redirect_url})
+            return ORJSONResponse({"answer": answer, "redirect": redirect_url})
 
-        return JSONResponse({"answer": answer})
+        return ORJSONResponse({"answer": answer})
     except Exception as e:
-        _log(f"Error in ask_bot: {e}")
-        return JSONResponse({"error": str(e)})
+        logger.error("Error in ask_bot: %s", e)
+        return ORJSONResponse({"error": str(e)})
 
 # === Download TTS audio (kept for later use) ===
 @app.get("/download_audio/{audio_file}")
@@ -145,7 +331,7 @@ async def download_audio(audio_file: str):
     file_path = os.path.join(BASE_DIR, "chatbot_sih", "data", "output_audio", audio_file)
     if os.path.exists(file_path):
         return FileResponse(file_path, media_type="audio/mpeg", filename=audio_file)
-    return JSONResponse({"error": "File not found"}, status_code=404)
+    return ORJSONResponse({"error": "File not found"}, status_code=404)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file